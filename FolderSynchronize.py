@@ -12,21 +12,64 @@ It needs the following parameters (which have to provided through command line):
 Author: Raigon Augustin
 Date: 22.09.2023
 """
+import errno
 import hashlib
+import json
 import os
 import logging
 import time
 import shutil
-from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor
+import stat
+import sys
+import threading
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from config import FolderSyncConfig
 
+try:
+    import blake3
+except ImportError:  # blake3 is an optional dependency, blake2b from hashlib is used when it is not installed
+    blake3 = None
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is an optional dependency, every sync cycle traverses the whole folders when it is not installed
+    Observer = None
+
+HASH_ALGORITHM = 'blake2b' if blake3 is None else 'blake3'
+
+
+def existing_directory(path: str):
+    """
+    Argument type of the source folder path. Checks once at startup that the folder exists
+    :param path:
+    :return: the path, if it is an existing directory
+    """
+    if not os.path.isdir(path):
+        raise ArgumentTypeError(f'The source folder path {path} does not exist')
+    return path
+
+
+def non_negative_int(value: str):
+    """
+    Argument type of the synchronization interval
+    :param value:
+    :return: the value as integer, if it is not negative
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f'{value} is not an integer')
+    if number < 0:
+        raise ArgumentTypeError(f'{value} should be a positive integer')
+    return number
+
 
 parser = ArgumentParser()
-parser.add_argument('--src_path', required=True)
+parser.add_argument('--src_path', type=existing_directory, required=True)
 parser.add_argument('--replica_path', required=True)
 parser.add_argument('--log_file_path', required=True)
-parser.add_argument('--sync_interval_in_seconds', type=int, required=True)
+parser.add_argument('--sync_interval_in_seconds', type=non_negative_int, required=True)
 args = parser.parse_args()
 
 
@@ -37,14 +80,32 @@ class FolderSynchronize:
     This class have methods which can copy files in parallel, check if the file in 2 directories are the same, and to synchronize between
     the source and a replica folders
     """
-    def __init__(self, source_folder_path: str, dest_folder_path: str):
+    def __init__(self, source_folder_path: str, dest_folder_path: str, hash_cache_path: str = None):
         """
-        Constructor of the FolderSynchronize class. Initialize the source, destination locations
+        Constructor of the FolderSynchronize class. Initialize the source, destination locations and the hash cache.
+        The source folder has to exist, the replica folder is created if it is not present
         :param source_folder_path:
         :param dest_folder_path:
+        :param hash_cache_path: Path to the file in which the file hashes are persisted between runs (optional)
         """
+        if not os.path.isdir(source_folder_path):
+            raise FileNotFoundError(f'The entered source folder path {source_folder_path} does not exist')
         self.source_folder_path = source_folder_path
         self.dest_folder_path = dest_folder_path
+        if not os.path.exists(dest_folder_path):
+            logger.info(f'The replica folder {dest_folder_path} is not present in the system. Creating the folder ..')
+            self.create_directory(dest_folder_path)
+        # Paths found while traversing a folder start with the folder path and a separator (as added by os.path.join()),
+        # hence relative paths are obtained by slicing off this prefix instead of calling os.path.relpath() and
+        # paths are built by concatenating it instead of calling os.path.join() for every file
+        self._src_prefix = os.path.join(source_folder_path, '')
+        self._src_prefix_len = len(self._src_prefix)
+        self._dest_prefix = os.path.join(dest_folder_path, '')
+        self.hash_cache_path = hash_cache_path
+        self._hash_cache: dict[tuple[str, int, int], bytes] = self.load_hash_cache(hash_cache_path)
+        self._used_hash_cache: dict[tuple[str, int, int], bytes] = {}
+        self._inode_cache: dict[tuple[int, int, int, int], bytes] = {}
+        self._copy_pool = None
 
     @staticmethod
     def create_directory(path_to_folder: str):
@@ -55,29 +116,273 @@ class FolderSynchronize:
         os.makedirs(path_to_folder)
         return
 
+    @staticmethod
+    def _fadvise(fd: int, advice: str):
+        """
+        Tells the kernel how the whole file is accessed (see os.posix_fadvise()). Does nothing on systems without
+        posix_fadvise (e.g. Windows and macOS)
+        :param fd: File descriptor of the file
+        :param advice: Name of the advice constant in the os module, e.g. 'POSIX_FADV_SEQUENTIAL'
+        :return: None
+        """
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+        return
+
     @staticmethod
     def create_hash_file(file_path: str):
         """
-        This function creates the hash file for a given file. To avoid inefficiencies while creating hash for large files
-        here file is read in chunks of a certain size (defined in the config file)
+        This function creates the hash file for a given file, using BLAKE3 if the blake3 package is installed and blake2b otherwise
         :param file_path:
         :return: hash file
         """
-        file_md5 = hashlib.md5()
-        with open(file_path, 'rb') as fp:
-            while True:
-                data = fp.read(FolderSyncConfig.hashing_file_chunk_size)
-                if not data:
-                    break
-                file_md5.update(data)
-        return file_md5
+        # Unbuffered, since the file is read in large chunks into a reused buffer. The file is not memory mapped: a source
+        # file truncated by another process while it is hashed would kill the process with SIGBUS
+        with open(file_path, 'rb', buffering=0) as fp:
+            FolderSynchronize._fadvise(fp.fileno(), 'POSIX_FADV_SEQUENTIAL')
+            try:
+                if blake3 is None and hasattr(hashlib, 'file_digest'):
+                    return hashlib.file_digest(fp, 'blake2b')
+                file_hash = blake3.blake3() if blake3 is not None else hashlib.blake2b()
+                chunk = memoryview(bytearray(FolderSyncConfig.hashing_file_chunk_size))
+                while True:
+                    chunk_size = fp.readinto(chunk)
+                    if not chunk_size:
+                        break
+                    file_hash.update(chunk[:chunk_size])
+                return file_hash
+            finally:
+                # The file is not read again in this sync cycle and should not evict more useful pages from the page cache
+                FolderSynchronize._fadvise(fp.fileno(), 'POSIX_FADV_DONTNEED')
+
+    @staticmethod
+    def load_hash_cache(hash_cache_path: str):
+        """
+        Loads the file hashes persisted by a previous run. A missing or unreadable cache file results in an empty cache
+        :param hash_cache_path:
+        :return: dictionary mapping (file path, file size, modification time in ns) to the file digest
+        """
+        if hash_cache_path is None or not os.path.exists(hash_cache_path):
+            return {}
+        try:
+            with open(hash_cache_path, 'r') as fp:
+                hash_cache = json.load(fp)
+            if hash_cache['algorithm'] != HASH_ALGORITHM:
+                logger.info(f'The hash cache {hash_cache_path} was created with {hash_cache["algorithm"]}. Starting with an empty cache.')
+                return {}
+            return {(path, size, mtime_ns): bytes.fromhex(digest) for path, size, mtime_ns, digest in hash_cache['entries']}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f'Could not read the hash cache {hash_cache_path}: {e}. Starting with an empty cache.')
+            return {}
+
+    def save_hash_cache(self, prune: bool = True):
+        """
+        Persists the file hashes used in the current run. Entries which were not looked up are dropped, so that
+        the cache does not keep growing with stale versions of modified or deleted files. The file is not written
+        again if the cache did not change
+        :param prune: False if only a part of the folders was synchronized, so that the other entries are kept
+        :return: None
+        """
+        hash_cache = self._used_hash_cache if prune else {**self._hash_cache, **self._used_hash_cache}
+        self._used_hash_cache = {}
+        if hash_cache == self._hash_cache:
+            return
+        self._hash_cache = hash_cache
+        if self.hash_cache_path is None:
+            return
+        with open(self.hash_cache_path, 'w') as fp:
+            json.dump({'algorithm': HASH_ALGORITHM,
+                       'entries': [[path, size, mtime_ns, digest.hex()] for (path, size, mtime_ns), digest in self._hash_cache.items()]}, fp)
+        return
+
+    def _lookup_digest(self, file_path: str, file_stat: os.stat_result):
+        """
+        Looks up the digest of the given file in the hash cache and, for hard links to the same file (same device and inode)
+        hashed within this sync cycle, in the inode cache
+        :param file_path:
+        :param file_stat:
+        :return: digest of the file, None if it is not cached
+        """
+        digest = self._hash_cache.get((file_path, file_stat.st_size, file_stat.st_mtime_ns))
+        if digest is None:
+            digest = self._inode_cache.get((file_stat.st_dev, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size))
+        return digest
+
+    def _store_digest(self, file_path: str, file_stat: os.stat_result, digest: bytes):
+        """
+        Stores the digest of the given file in the hash cache and the inode cache
+        :param file_path:
+        :param file_stat:
+        :param digest:
+        :return: None
+        """
+        self._used_hash_cache[(file_path, file_stat.st_size, file_stat.st_mtime_ns)] = digest
+        self._inode_cache[(file_stat.st_dev, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)] = digest
+        return
+
+    def _cached_digest(self, file_path: str, file_stat: os.stat_result = None):
+        """
+        Returns the digest of the given file. The file is only read and hashed if its size or modification time
+        changed since the digest was last computed. Within a sync cycle, hard links to the same file (same device and inode)
+        are hashed only once
+        :param file_path:
+        :param file_stat: stat result of the file, if already available
+        :return: digest of the file
+        """
+        if file_stat is None:
+            file_stat = os.stat(file_path)
+        digest = self._lookup_digest(file_path, file_stat)
+        if digest is None:
+            digest = self.create_hash_file(file_path).digest()
+        self._store_digest(file_path, file_stat, digest)
+        return digest
 
-    def is_file_modified(self, source_file: str, destination_file: str):
+    @staticmethod
+    def compare_file_contents(source_file: str, destination_file: str, file_size: int):
         """
-        This function checks if the given file present in the source and replica folders are modified after the last run
-        :return: True if file was modified, False otherwise
+        Compares the content of 2 files by reading them chunk by chunk in lockstep, so that the comparison stops at the first
+        differing chunk instead of reading both the files completely. While comparing, the content is hashed once, so that the
+        digest of equal files can be cached
+        :param source_file:
+        :param destination_file:
+        :param file_size: Size of the files, so that small files do not allocate and compare a whole chunk
+        :return: digest of the content if the files are equal, None otherwise
         """
-        return self.create_hash_file(source_file).hexdigest() == self.create_hash_file(destination_file).hexdigest()
+        file_hash = hashlib.blake2b() if blake3 is None else blake3.blake3()
+        # At least 1 byte, so that reading reaches the end of a file which grew after it was stat-ed
+        chunk_size = max(min(FolderSyncConfig.comparing_file_chunk_size, file_size), 1)
+        source_buffer = bytearray(chunk_size)
+        destination_buffer = bytearray(chunk_size)
+        source_chunk = memoryview(source_buffer)
+        with open(source_file, 'rb', buffering=0) as source_fp, open(destination_file, 'rb', buffering=0) as destination_fp:
+            for fp in (source_fp, destination_fp):
+                FolderSynchronize._fadvise(fp.fileno(), 'POSIX_FADV_SEQUENTIAL')
+            files_equal = False
+            try:
+                while True:
+                    source_size = source_fp.readinto(source_buffer)
+                    destination_size = destination_fp.readinto(destination_buffer)
+                    # The whole buffers are compared: bytes beyond the chunk read are left over from the previous, equal chunks
+                    if source_size != destination_size or source_buffer != destination_buffer:
+                        return None
+                    if not source_size:
+                        files_equal = True
+                        return file_hash.digest()
+                    file_hash.update(source_chunk[:source_size])
+            finally:
+                # Like after hashing, the compared content should not evict more useful pages from the page cache. A differing
+                # source file is copied right after, hence its pages are kept
+                FolderSynchronize._fadvise(destination_fp.fileno(), 'POSIX_FADV_DONTNEED')
+                if files_equal:
+                    FolderSynchronize._fadvise(source_fp.fileno(), 'POSIX_FADV_DONTNEED')
+
+    @staticmethod
+    def _files_probably_equal(source_entry: os.DirEntry, destination_entry: os.DirEntry):
+        """
+        Checks if the files have the same file type, size and modification time, like rsync's quick check
+        :param source_entry:
+        :param destination_entry:
+        :return: True if file type, size and modification time of both the files match, False otherwise
+        """
+        source_stat = source_entry.stat()
+        destination_stat = destination_entry.stat()
+        return (stat.S_IFMT(source_stat.st_mode) == stat.S_IFMT(destination_stat.st_mode)
+                and source_stat.st_size == destination_stat.st_size
+                and source_stat.st_mtime_ns == destination_stat.st_mtime_ns)
+
+    def is_file_modified(self, source_file: str, destination_file: str,
+                         source_stat: os.stat_result = None, destination_stat: os.stat_result = None):
+        """
+        This function checks if the given file present in the source and replica folders are modified after the last run.
+        Files of different size are modified without reading them. If the digest of one of the files is cached, only the
+        other one is hashed, otherwise the file contents are compared directly (see compare_file_contents)
+        :param source_file:
+        :param destination_file:
+        :param source_stat: stat result of the source file, if already available
+        :param destination_stat: stat result of the replica file, if already available
+        :return: True if the files are still the same (file was not modified), False otherwise
+        """
+        if source_stat is None:
+            source_stat = os.stat(source_file)
+        if destination_stat is None:
+            destination_stat = os.stat(destination_file)
+        if source_stat.st_size != destination_stat.st_size:
+            return False
+        if self._lookup_digest(source_file, source_stat) is None and self._lookup_digest(destination_file, destination_stat) is None:
+            digest = self.compare_file_contents(source_file, destination_file, source_stat.st_size)
+            if digest is None:
+                return False
+            self._store_digest(source_file, source_stat, digest)
+            self._store_digest(destination_file, destination_stat, digest)
+            return True
+        return self._cached_digest(source_file, source_stat) == self._cached_digest(destination_file, destination_stat)
+
+    @staticmethod
+    def _kernel_copy(source_fd: int, destination_fd: int, file_size: int):
+        """
+        Copies the file content inside the kernel with os.copy_file_range() or, on Linux, os.sendfile()
+        :param source_fd: File descriptor of the source file
+        :param destination_fd: File descriptor of the empty destination file
+        :param file_size: Size of the source file
+        :return: True if the file was copied, False if neither system call is supported for these files
+        """
+        block_size = min(max(file_size, 2 ** 23), 2 ** 30)
+        copy_functions = []
+        if hasattr(os, 'copy_file_range'):
+            copy_functions.append(lambda: os.copy_file_range(source_fd, destination_fd, block_size))
+        # Like in shutil, since on other systems os.sendfile() only writes to sockets
+        if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            copy_functions.append(lambda: os.sendfile(destination_fd, source_fd, None, block_size))
+        for copy_function in copy_functions:
+            copied_size = 0
+            try:
+                while True:
+                    sent = copy_function()
+                    copied_size += sent
+                    # Stops as soon as the expected size is copied, instead of issuing one more system call per file
+                    # which only reports the end of the file
+                    if sent == 0 or 0 < file_size <= copied_size:
+                        break
+            except OSError as e:
+                # Fall back only if nothing was written yet, otherwise it is a real error (e.g. disk full)
+                if copied_size == 0 and e.errno in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSUP,
+                                                    errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF):
+                    continue
+                raise
+            # Some special filesystems report a size but return no data through these system calls
+            if copied_size == 0 and file_size > 0:
+                continue
+            return True
+        return False
+
+    @staticmethod
+    def _fast_copy(source_file: str, destination_file: str):
+        """
+        Copies the file along with its metadata like shutil.copy2(), but copies the content inside the kernel if possible
+        and falls back to shutil.copyfile() otherwise
+        :param source_file:
+        :param destination_file:
+        :return: None
+        """
+        # Opening a named pipe for reading blocks until a writer appears, hence the source is opened non-blocking and
+        # rejected like shutil.copyfile() does if it is not a regular file
+        source_fd = os.open(source_file, os.O_RDONLY | getattr(os, 'O_NONBLOCK', 0))
+        try:
+            if not stat.S_ISREG(os.fstat(source_fd).st_mode):
+                raise shutil.SpecialFileError(f'`{source_file}` is not a regular file')
+            if hasattr(os, 'O_NONBLOCK'):
+                os.set_blocking(source_fd, True)
+            destination_fd = os.open(destination_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            try:
+                copied = FolderSynchronize._kernel_copy(source_fd, destination_fd, os.fstat(source_fd).st_size)
+            finally:
+                os.close(destination_fd)
+        finally:
+            os.close(source_fd)
+        if not copied:
+            shutil.copyfile(source_file, destination_file)
+        shutil.copystat(source_file, destination_file)
+        return
 
     @staticmethod
     def copy_file(s):
@@ -87,152 +392,399 @@ class FolderSynchronize:
         :return: None
         """
         if s[2] == 'new':
-            logger.info(f'Copying new file {s[0]} to {s[1]}')
+            logger.info('Copying new file %s to %s', s[0], s[1])
         else:
-            logger.info(f'Updating modified file {s[0]} to {s[1]}')
-        shutil.copy2(s[0], s[1])
+            logger.info('Updating modified file %s to %s', s[0], s[1])
+        FolderSynchronize._fast_copy(s[0], s[1])
         return
 
+    def _get_copy_pool(self):
+        """
+        Returns the thread pool used for copying the files. It is created on first use and kept alive across the sync
+        cycles, so that the worker threads are not created and torn down again for every batch of files
+        :return: ThreadPoolExecutor
+        """
+        if self._copy_pool is None:
+            self._copy_pool = ThreadPoolExecutor(max_workers=FolderSyncConfig.max_workers, thread_name_prefix='copy')
+        return self._copy_pool
+
     @staticmethod
-    def copy_files_executor(copy_file, process_list, max_workers):
+    def _collect_file_copies(pending_copies: dict, finished_copies):
         """
-        Executes file copying tasks concurrently using a ThreadPoolExecutor.
-        :param copy_file: The function responsible for copying a single file.
-        :param process_list: A list of files to be copied.
-        :param max_workers: The maximum number of worker threads to use for concurrent copying.
+        Removes the finished copy tasks from the pending ones. A file which could not be copied is logged and
+        retried in the next sync cycle
+        :param pending_copies: dictionary mapping the futures of the submitted copy tasks to the copied file
+        :param finished_copies: futures of the finished copy tasks
+        :return: None
         """
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            executor.map(copy_file, process_list)
+        for future in finished_copies:
+            s = pending_copies.pop(future)
+            copy_error = future.exception()
+            if copy_error is not None:
+                logger.error('Could not copy the file %s to %s: %s', s[0], s[1], copy_error)
         return
 
-    def create_new_directory_in_replica_folder(self, source_root, source_directories):
+    def submit_file_copy(self, pending_copies: dict, s):
+        """
+        Submits the copying of a file to the long-running copy thread pool, so that files are copied while the folders are
+        still being traversed. If the number of pending copies reached the threshold (defined in the config file), it waits
+        until one of them is finished
+        :param pending_copies: dictionary mapping the futures of the submitted copy tasks to the copied file
+        :param s: list containing path to source file, target location and field indicating if file is modified or newly created
+        :return: None
+        """
+        if len(pending_copies) >= FolderSyncConfig.file_copy_batch_size:
+            finished_copies, _ = wait(pending_copies, return_when=FIRST_COMPLETED)
+            self._collect_file_copies(pending_copies, finished_copies)
+        pending_copies[self._get_copy_pool().submit(self.copy_file, s)] = s
+        return
+
+    def wait_for_file_copies(self, pending_copies: dict):
+        """
+        Waits until all the submitted copy tasks are finished
+        :param pending_copies: dictionary mapping the futures of the submitted copy tasks to the copied file
+        :return: None
+        """
+        finished_copies, _ = wait(pending_copies)
+        self._collect_file_copies(pending_copies, finished_copies)
+        return
+
+    def _compare_file_pair(self, s):
+        """
+        Calls is_file_modified for a pair of files. A pair which could not be compared is logged and retried in the next sync cycle
+        :param s: list containing the source and replica file paths and their stat results
+        :return: result of is_file_modified, None if the files could not be compared
+        """
+        try:
+            return self.is_file_modified(*s)
+        except OSError as e:
+            logger.error('Could not compare the file %s with %s: %s', s[0], s[1], e)
+            return None
+
+    def compare_files_executor(self, files_to_compare, max_workers):
+        """
+        Checks concurrently using a ThreadPoolExecutor if the given files have been modified. Hashing is I/O bound,
+        hence reading several files at once makes better use of the disk
+        :param files_to_compare: A list containing the source and replica file paths and their stat results.
+        :param max_workers: The maximum number of worker threads to use for concurrent hashing.
+        :return: list with the result of _compare_file_pair for each pair, in the same order as files_to_compare
+        """
+        if len(files_to_compare) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._compare_file_pair, files_to_compare))
+
+    @staticmethod
+    def scandir_walk(top: str, unlisted_directories: list = None):
+        """
+        Traverses the directory tree top-down like os.walk(), but yields os.DirEntry objects and raises if top cannot be listed
+        :param top: Path to the directory to traverse
+        :param unlisted_directories: If given, the paths of the directories which could not be listed are appended to it
+        :return: generator of (root, directory entries, file entries) tuples
+        """
+        roots = [top]
+        while roots:
+            root = roots.pop()
+            directories, files = [], []
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            directories.append(entry)
+                        else:
+                            files.append(entry)
+            except OSError as e:
+                if root is top:
+                    raise
+                logger.warning(f'Could not list the directory {root}: {e}')
+                if unlisted_directories is not None:
+                    unlisted_directories.append(root)
+                continue
+            yield root, directories, files
+            roots.extend(reversed([entry.path for entry in directories if not entry.is_symlink()]))
+
+    def _scan_tree(self, top: str, prefix_len: int = None):
+        """
+        Lists all the directories and files below the given folder in a single traversal
+        :param top: Path to the directory to traverse
+        :param prefix_len: Length of the prefix to slice off the paths, by default the one of top
+        :return: dictionary mapping the path relative to top (or the prefix) to the os.DirEntry of each directory and file
+        """
+        tree_index = {}
+        if prefix_len is None:
+            prefix_len = len(os.path.join(top, ''))
+        for root, directories, files in self.scandir_walk(top):
+            for entry in directories + files:
+                tree_index[entry.path[prefix_len:]] = entry
+        return tree_index
+
+    def create_new_directory_in_replica_folder(self, source_directories, dest_index):
         """
         This function creates directories which are present in the source folder and not yet present in the replica folder
-        :param source_root:
-        :param source_directories:
+        :param source_directories: os.DirEntry objects of the source directories
+        :param dest_index: dictionary of the relative paths present in the replica folder (see _scan_tree)
         :return: None
         """
         for directory in source_directories:
-            src_dir = os.path.join(source_root, directory)
-            dest_dir = os.path.join(self.dest_folder_path, os.path.relpath(src_dir, self.source_folder_path))
-            if not os.path.exists(dest_dir):
+            rel_path = directory.path[self._src_prefix_len:]
+            if rel_path not in dest_index:
+                dest_dir = self._dest_prefix + rel_path
                 self.create_directory(dest_dir)
-                logger.info(f'Non-existent directory {dest_dir} created in the replica folder!!')
+                logger.info('Non-existent directory %s created in the replica folder!!', dest_dir)
 
         return
 
-    def remove_unwanted_directories_in_replica_folder(self, destination_root, destination_directories):
+    def is_present_in_source(self, rel_path, src_index):
         """
-        This function removes the directories from replica folder which are not present in the source folder
-        :param destination_root:
-        :param destination_directories:
-        :return:
+        Checks if the given path relative to the source folder is present in the source folder
+        :param rel_path:
+        :param src_index: set of the relative paths found while traversing the source folder, None if the traversal
+        was incomplete. In that case the file system is checked instead
+        :return: True if the path is present in the source folder, False otherwise
         """
-        for directory in destination_directories:
-            dest_dir = os.path.join(destination_root, directory)
-            src_dir = os.path.join(self.source_folder_path, os.path.relpath(dest_dir, self.dest_folder_path))
-            if not os.path.exists(src_dir):
-                os.removedirs(dest_dir)
-                logger.info(
-                    f'Directory {dest_dir} not present in the source folder. Deleting it from the Replica Folder!!')
-        return
+        if src_index is None:
+            return os.path.exists(self._src_prefix + rel_path)
+        return rel_path in src_index
+
+    def remove_unwanted_directories_in_replica_folder(self, dest_index, src_index):
+        """
+        This function removes the directories from replica folder which are not present in the source folder. A missing
+        subtree is removed at its top with a single shutil.rmtree() call instead of deleting every file and directory below it
+        :param dest_index: dictionary of the relative paths present in the replica folder (see _scan_tree)
+        :param src_index: set of the relative paths present in the source folder (see is_present_in_source)
+        :return: set of the relative paths of the removed directories, including the ones below a removed directory
+        """
+        removed_directories = set()
+        # The index lists every directory before its content, hence parents are handled before their subdirectories
+        for rel_path, directory in dest_index.items():
+            if not directory.is_dir():
+                continue
+            if os.path.dirname(rel_path) in removed_directories:
+                removed_directories.add(rel_path)
+            elif not self.is_present_in_source(rel_path, src_index):
+                if directory.is_symlink():
+                    os.remove(directory.path)
+                else:
+                    shutil.rmtree(directory.path)
+                removed_directories.add(rel_path)
+                logger.info('Directory %s not present in the source folder. Deleting it from the Replica Folder!!', directory.path)
+        return removed_directories
 
-    def remove_unwanted_files_in_replica_folder(self, destination_root, destination_files):
+    def remove_unwanted_files_in_replica_folder(self, dest_index, src_index, removed_directories):
         """
         This function removes the files from the replica folder which are not present in the source folder
-        :param destination_root:
-        :param destination_files:
+        :param dest_index: dictionary of the relative paths present in the replica folder (see _scan_tree)
+        :param src_index: set of the relative paths present in the source folder (see is_present_in_source)
+        :param removed_directories: set of the relative paths of the directories which were already removed
         :return:
         """
-        for file in destination_files:
-            dest_file = os.path.join(destination_root, file)
-            src_file = os.path.join(self.source_folder_path, os.path.relpath(dest_file, self.dest_folder_path))
-
-            if os.path.exists(src_file):
+        for rel_path, file in dest_index.items():
+            if file.is_dir() or os.path.dirname(rel_path) in removed_directories:
+                continue
+            if self.is_present_in_source(rel_path, src_index):
                 continue
             else:
-                os.remove(dest_file)
-                logger.info(f'Deleting the file {dest_file} which is not present in the source folder.')
+                os.remove(file.path)
+                logger.info('Deleting the file %s which is not present in the source folder.', file.path)
         return
 
-    def sync_source_with_replica(self):
+    def sync_paths(self, changed_paths):
         """
-        This function syncs the source folder with the replica folder
+        This function syncs only the part of the source and replica folders which contains the given changed paths,
+        i.e. the deepest folder which is a parent of all of them and still exists in the source folder
+        :param changed_paths: set of changed paths below the source or replica folder (see FolderChangeTracker)
         :return:
         """
+        changed_folders = set()
+        for path in changed_paths:
+            if path.startswith(self._src_prefix):
+                changed_folders.add(os.path.dirname(path[self._src_prefix_len:]))
+            elif path.startswith(self._dest_prefix):
+                changed_folders.add(os.path.dirname(path[len(self._dest_prefix):]))
+            else:
+                # The source or replica folder itself changed
+                changed_folders.add('')
+        rel_folder = os.path.commonpath(changed_folders) if changed_folders else ''
+        # Like the full sync, the partial sync must not descend into a symlinked directory, hence it starts above the first
+        # component which is a symlink or no directory
+        synced_folder = ''
+        for name in rel_folder.split(os.sep) if rel_folder else []:
+            folder = os.path.join(synced_folder, name)
+            if os.path.islink(self._src_prefix + folder) or not os.path.isdir(self._src_prefix + folder):
+                break
+            synced_folder = folder
+        rel_folder = synced_folder
+        try:
+            self.sync_source_with_replica(rel_folder)
+        except FileNotFoundError:
+            if not rel_folder:
+                raise
+            # The folder was deleted in the meantime
+            self.sync_source_with_replica()
+        return
 
-        if not os.path.exists(self.source_folder_path):
-            logger.error(f'The entered source folder path {self.source_folder_path} does not exist')
-            exit(1)
+    def sync_source_with_replica(self, rel_folder: str = ''):
+        """
+        This function syncs the source folder with the replica folder
+        :param rel_folder: Path of a folder relative to the source folder, if only this part of the folders has to be synced
+        :return:
+        """
+        src_top = self._src_prefix + rel_folder if rel_folder else self.source_folder_path
+        dest_top = self._dest_prefix + rel_folder if rel_folder else self.dest_folder_path
 
-        if not os.path.exists(self.dest_folder_path):
-            logger.info(f'The replica folder {self.dest_folder_path} is not present in the system. Creating the folder ..')
-            self.create_directory(self.dest_folder_path)
+        # Inode numbers of deleted files are reused for new files, hence digests by inode are only reused within a cycle
+        self._inode_cache.clear()
 
-        files_to_copy = []
+        pending_copies = {}
+        files_to_compare = []
+        src_index = set()
+        unlisted_src_directories = []
 
-        # Recursively traverse the source directory structure starting from 'self.source_folder_path'
-        # using os.walk() to iterate through source roots, directories, and files.
-        for src_root, src_dirs, src_files in os.walk(self.source_folder_path):
+        # The replica folder is listed once, so that checking if a file is present in it is a dictionary lookup
+        try:
+            dest_index = self._scan_tree(dest_top, len(self._dest_prefix))
+        except FileNotFoundError:
+            logger.info(f'The replica folder {dest_top} is not present anymore. Creating the folder ..')
+            self.create_directory(dest_top)
+            dest_index = {}
+
+        # Attributes and methods used for every file are bound to local names, to avoid looking them up in each iteration
+        src_prefix_len = self._src_prefix_len
+        dest_prefix = self._dest_prefix
+        get_dest_entry = dest_index.get
+        add_to_src_index = src_index.add
+        files_probably_equal = self._files_probably_equal
+        submit_file_copy = self.submit_file_copy
+
+        # Phase 1: Recursively traverse the source directory structure starting from 'src_top'
+        # using os.scandir() to iterate through source roots, directories, and files.
+        for src_root, src_dirs, src_files in self.scandir_walk(src_top, unlisted_src_directories):
 
             # Creates new directories in replica folder which are not yet present
-            self.create_new_directory_in_replica_folder(src_root, src_dirs)
-
-            # Check if the file is present in the replica folder and copies if not present or it has been modified
-            for file in src_files:
-                src_file = os.path.join(src_root, file)
-                dest_file = os.path.join(self.dest_folder_path, os.path.relpath(src_file, self.source_folder_path))
-                if os.path.exists(dest_file):
-                    if not self.is_file_modified(src_file, dest_file):  # Checks if the file has been modified after last sync
-                        os.remove(dest_file)
-                        logger.info(f'Deleting the old file {dest_file} from the destination')
-                        files_to_copy.append([src_file, dest_file, 'modified']) # File to copy added to the list
-                    else:
+            self.create_new_directory_in_replica_folder(src_dirs, dest_index)
+            src_index.update(src_dir.path[src_prefix_len:] for src_dir in src_dirs)
+
+            # Check if the file is present in the replica folder and copies if not present.
+            # Files present in both folders are collected to check if they have been modified
+            for src_entry in src_files:
+                src_file = src_entry.path
+                rel_path = src_file[src_prefix_len:]
+                dest_file = dest_prefix + rel_path
+                dest_entry = get_dest_entry(rel_path)
+                add_to_src_index(rel_path)
+                if dest_entry is not None:
+                    # Files are only hashed if size or modification time differ
+                    if files_probably_equal(src_entry, dest_entry):
                         logger.debug('File not modified. No need to copy!!')
-                        continue
+                    else:
+                        # The stat results cached in the entries are passed on, so that the files are not stat-ed again
+                        files_to_compare.append([src_file, dest_file, src_entry.stat(), dest_entry.stat()])
                 else:
-                    logger.debug(f'File {dest_file} not present in Replica Folder. Adding to the list')
-                    files_to_copy.append([src_file, dest_file, 'new'])  # File to copy added to the list
-                    if len(files_to_copy) >= FolderSyncConfig.file_copy_batch_size:
-                        logger.debug(f'Number of files to copy exceeded the threshold. Starting the parallel copy...')
-                        self.copy_files_executor(self.copy_file, files_to_copy, FolderSyncConfig.max_workers)  # Calls the function to perform parallel copy of the files
-                        logger.debug(f'Completed the copying')
-                        files_to_copy = []
+                    logger.debug('File %s not present in Replica Folder. Starting the copy', dest_file)
+                    submit_file_copy(pending_copies, [src_file, dest_file, 'new'])  # Copied in parallel while the walk continues
+
+        # Phase 2: Hash the collected files in parallel and check if they have been modified after last sync
+        for (src_file, dest_file, _, _), not_modified in zip(files_to_compare, self.compare_files_executor(files_to_compare, FolderSyncConfig.max_workers)):
+            if not_modified is None:
+                continue
+            if not_modified:
+                logger.debug('File not modified. No need to copy!!')
+                continue
+            os.remove(dest_file)
+            logger.info('Deleting the old file %s from the destination', dest_file)
+            self.submit_file_copy(pending_copies, [src_file, dest_file, 'modified'])
+
+        logger.debug('Waiting for the remaining files to be copied to the destination folder.')
+        self.wait_for_file_copies(pending_copies)
+
+        # Without a complete listing of the source folder, files in the replica folder must not be deleted
+        # just because they are missing in the index
+        if unlisted_src_directories:
+            src_index = None
 
-        if len(files_to_copy) > 0:
-            logger.debug('Copying the remaining files to the destination folder.')
-            self.copy_files_executor(self.copy_file, files_to_copy, FolderSyncConfig.max_workers)
+        # The replica folder listed before the copying is used to find the entries which are not present in the source
+        # folder. Entries created in the meantime are copies of source files, hence it is not traversed again.
+        # Removes the folders from the replica directory which are not present in the source directory
+        removed_dest_directories = self.remove_unwanted_directories_in_replica_folder(dest_index, src_index)
 
-        # Recursively traverse the replica directory structure starting from 'self.dest_folder_path'
-        # using os.walk() to iterate through source roots, directories, and files.
-        for dest_root, dest_dirs, dest_files in os.walk(self.dest_folder_path, topdown=False):
+        # Removes files in replica folder which are not present in the source folder
+        self.remove_unwanted_files_in_replica_folder(dest_index, src_index, removed_dest_directories)
 
-            # Removes files in replica folder which are not present in the source folder
-            self.remove_unwanted_files_in_replica_folder(dest_root, dest_files)
+        self.save_hash_cache(prune=not rel_folder)
+
+        return
 
-            # Removes the folders from the replica directory which are not present in the source directory
-            self.remove_unwanted_directories_in_replica_folder(dest_root, dest_dirs)
 
+class FolderChangeTracker:
+    """
+    FolderChangeTracker class
+
+    This class collects the paths which changed in the watched folders, as reported by the observer of the watchdog package,
+    so that a sync cycle can be skipped if nothing changed, or limited to the changed part of the folders
+    """
+    # Events of files which were only read (e.g. while hashing them) do not change anything
+    ignored_event_types = {'opened', 'closed_no_write'}
+
+    def __init__(self, folder_paths):
+        """
+        Constructor of the FolderChangeTracker class. Starts watching the given folders recursively. Raises OSError if the
+        folders cannot be watched, e.g. when the inotify watch limit is reached on large trees
+        :param folder_paths: Paths to the folders to watch
+        """
+        self._lock = threading.Lock()
+        self._changed_paths = set()
+        self._observer = Observer()
+        try:
+            for folder_path in folder_paths:
+                self._observer.schedule(self, folder_path, recursive=True)
+            self._observer.start()
+        except OSError:
+            self._observer.stop()
+            raise
+
+    def dispatch(self, event):
+        """
+        Called by the observer thread for every file system event in the watched folders
+        :param event: watchdog FileSystemEvent
+        :return: None
+        """
+        if event.event_type in self.ignored_event_types:
+            return
+        with self._lock:
+            self._changed_paths.add(event.src_path)
+            if getattr(event, 'dest_path', ''):
+                self._changed_paths.add(event.dest_path)
         return
 
+    def pop_changed_paths(self):
+        """
+        Returns the paths which changed since the last call. Besides the observer thread, which dispatches the events, the
+        emitter threads, which read them for each watched folder, are checked: an emitter stops e.g. when its watched folder
+        is deleted
+        :return: set of changed paths, None if the observer or one of the emitters stopped and changes may have been missed
+        """
+        with self._lock:
+            changed_paths, self._changed_paths = self._changed_paths, set()
+        if not self._observer.is_alive() or not all(emitter.is_alive() for emitter in self._observer.emitters):
+            return None
+        return changed_paths
+
 
 def is_input_parameters_valid():
     """
-    Checks the correctness of the input parameters
+    Checks the correctness of the parameters defined in the config file. The command line arguments are already
+    validated by the argument parser
     :return: True if all the parameters are valid, False otherwise
     """
 
-    if type(args.src_path) is not str:
-        logger.error(f'The argument {args.src_path} should be a string.')
-        return False
-    if type(args.replica_path) is not str:
-        logger.error(f'The argument replica_path should be a string.')
+    if type(FolderSyncConfig.hashing_file_chunk_size) is not int or FolderSyncConfig.hashing_file_chunk_size <= 0:
+        logger.error(f'The argument hashing_file_chunk_size should be a positive integer.')
         return False
-    if type(args.sync_interval_in_seconds) is not int or args.sync_interval_in_seconds < 0:
-        logger.error(f'The argument sync_interval_in_seconds should be a positive integer.')
+    if type(FolderSyncConfig.comparing_file_chunk_size) is not int or FolderSyncConfig.comparing_file_chunk_size <= 0:
+        logger.error(f'The argument comparing_file_chunk_size should be a positive integer.')
         return False
-    if type(FolderSyncConfig.hashing_file_chunk_size) is not int or FolderSyncConfig.hashing_file_chunk_size < 0:
-        logger.error(f'The argument hashing_file_chunk_size should be a positive integer.')
+    if type(FolderSyncConfig.full_sync_interval_in_cycles) is not int or FolderSyncConfig.full_sync_interval_in_cycles <= 0:
+        logger.error(f'The argument full_sync_interval_in_cycles should be a positive integer.')
         return False
     if type(FolderSyncConfig.max_workers) is not int or FolderSyncConfig.max_workers < 0:
         print(FolderSyncConfig.max_workers)
@@ -278,16 +830,34 @@ if __name__ == '__main__':
     logger.addHandler(log_file_handler)
 
     if is_input_parameters_valid():
-        sync_obj = FolderSynchronize(args.src_path, args.replica_path)
-
-        while True:
-            try:
-                logger.info('Calling the folder synchronization function')
-                sync_obj.sync_source_with_replica()
-            except Exception as e:
-                logger.error(e)
-                exit(1)
-            time.sleep(args.sync_interval_in_seconds)
+        hash_cache_path = os.path.join(os.path.dirname(os.path.abspath(args.log_file_path)), FolderSyncConfig.hash_cache_file_name)
+        try:
+            sync_obj = FolderSynchronize(args.src_path, args.replica_path, hash_cache_path)
+            # Without watchdog, or if the folders cannot be watched, the whole folders are traversed in every cycle
+            change_tracker = None
+            if Observer is not None:
+                try:
+                    change_tracker = FolderChangeTracker([args.src_path, args.replica_path])
+                except OSError as e:
+                    logger.warning(f'Could not watch the folders for changes: {e}. The whole folders are synchronized in every cycle.')
+
+            cycle = 0
+            while True:
+                changed_paths = None if change_tracker is None else change_tracker.pop_changed_paths()
+                # A full sync is done regularly in case the observer missed events (e.g. on a queue overflow)
+                if changed_paths is None or cycle % FolderSyncConfig.full_sync_interval_in_cycles == 0:
+                    logger.info('Calling the folder synchronization function')
+                    sync_obj.sync_source_with_replica()
+                elif changed_paths:
+                    logger.info('Calling the folder synchronization function for the changed paths')
+                    sync_obj.sync_paths(changed_paths)
+                else:
+                    logger.debug('No changes since the last synchronization')
+                cycle += 1
+                time.sleep(args.sync_interval_in_seconds)
+        except Exception as e:
+            logger.error(e)
+            exit(1)
     else:
         logger.error(f'Please recheck the input parameters!!')
         exit(1)
@@ -1,4 +1,7 @@
 class FolderSyncConfig:
     file_copy_batch_size = 50
     max_workers = 20
-    hashing_file_chunk_size = 4096
\ No newline at end of file
+    hashing_file_chunk_size = 2 ** 18
+    comparing_file_chunk_size = 1024 ** 2
+    hash_cache_file_name = 'FolderSyncHashCache.json'
+    full_sync_interval_in_cycles = 60